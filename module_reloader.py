@@ -1,19 +1,66 @@
 import importlib
 import sys
-from typing import Dict, List, Optional, Type, Any
+import functools
+from typing import Callable, Dict, List, Optional, Tuple, Type, Any
 #import numpy
 
 import importlib.util
 import threading
+import concurrent.futures
 import ctypes
 import time
 import shutil
 import os
 from datetime import datetime
 import hashlib
+import mmap
+import tempfile
 
 import module_thread_template
 
+# Backup deduplication only needs a fast content hash, so prefer BLAKE3 when available
+try:
+    import blake3
+    _fasthash = blake3.blake3
+    _FASTHASH_NAME = "blake3"
+except ImportError:
+    blake3 = None
+    _fasthash = hashlib.sha256
+    _FASTHASH_NAME = "sha256"
+
+# Pristine hash object; new hashers are copied from it instead of constructed.
+# It is never updated, so copying it is safe from any thread.
+_HASH_TEMPLATE = _fasthash()
+
+# Files at or above this size are hashed through mmap instead of read()
+MMAP_HASH_THRESHOLD = 10 * 1024 * 1024
+
+# Files above this size are hashed by BLAKE3 on multiple threads (if blake3 is installed)
+PARALLEL_HASH_THRESHOLD = 32 * 1024 * 1024
+
+# Number of most recent backups kept per module
+MAX_BACKUPS = 8
+
+# Compiler directives used when building Cython versions of modules. User modules
+# keep Cython's safe defaults, so indexing behaves exactly like in Python.
+CYTHON_DIRECTIVES = {'language_level': 3}
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_spec(module_name: str, path: str, mtime_ns: int):
+    """
+    Create a module spec for a file, memoized by the file's modification time.
+    
+    Args:
+        module_name (str): Name of the module
+        path (str): Path to the module file
+        mtime_ns (int): Modification time of the file, so edits produce a new spec
+        
+    Returns:
+        The module spec, or None if it could not be created
+    """
+    return importlib.util.spec_from_file_location(module_name, path)
+
 
 class ModuleReloader:
     """
@@ -27,28 +74,121 @@ class ModuleReloader:
         self._thread_configs = {}  # Store thread configurations
         self.module_path = {}
         self.backup_dir = "module_backups"
+        self._hash_cache: Dict[str, Tuple[int, int, str]] = {}  # path -> (mtime_ns, size, hash)
+        self._backup_index: Optional[Dict[str, List[Tuple[str, float]]]] = None  # module -> [(filename, mtime)]
+        self._backup_index_lock = threading.Lock()
+        # Backups are written in the background by a single worker to serialize disk writes
+        self._backup_pool = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self._backup_futures: Dict[str, concurrent.futures.Future] = {}
+        self._pending_cythonize: List[Tuple[str, str]] = []  # (module_name, source_path)
+        self._func_cache: Dict[Tuple[str, str], Callable] = {}  # (module_name, function_name) -> function
         
         # Create backup directory if it doesn't exist
-        if not os.path.exists(self.backup_dir):
-            os.makedirs(self.backup_dir)
+        os.makedirs(self.backup_dir, exist_ok=True)
     
-    def _calculate_file_hash(self, file_path: str) -> str:
+    def _calculate_file_hash(self, file_path: str, st: Optional[os.stat_result] = None) -> str:
         """
-        Calculate SHA-256 hash of a file.
+        Calculate a content hash of a file (BLAKE3 if installed, SHA-256 otherwise).
+        
+        Results are cached by (mtime, size) so unchanged files are not rehashed.
+        The digest is prefixed with the algorithm name, so hashes from different
+        algorithms never compare equal.
         
         Args:
             file_path (str): Path to the file to hash
+            st (Optional[os.stat_result]): Already known stat result of the file
             
         Returns:
-            str: SHA-256 hash of the file
+            str: Hash of the file in the form "<algorithm>:<hexdigest>"
         """
         try:
-            with open(file_path, 'rb') as f:
-                return hashlib.sha256(f.read()).hexdigest()
+            if st is None:
+                st = os.stat(file_path)
+            key = (st.st_mtime_ns, st.st_size)
+            cached = self._hash_cache.get(file_path)
+            if cached and cached[:2] == key:
+                return cached[2]
+
+            if blake3 is not None and st.st_size > PARALLEL_HASH_THRESHOLD:
+                # Very large files: BLAKE3 splits the work across all cores
+                hasher = blake3.blake3(max_threads=blake3.blake3.AUTO)
+                digest = hasher.update_mmap(file_path).hexdigest()
+            else:
+                digest = self._hash_file_contents(file_path, st)
+
+            file_hash = f"{_FASTHASH_NAME}:{digest}"
+            self._hash_cache[file_path] = (key[0], key[1], file_hash)
+            return file_hash
         except Exception as e:
             print(f"Error calculating hash for {file_path}: {str(e)}")
             return ""
 
+    def _hash_file_contents(self, file_path: str, st: os.stat_result) -> str:
+        """
+        Hash a file on a single thread with the fast hash algorithm.
+        
+        Args:
+            file_path (str): Path to the file to hash
+            st (os.stat_result): Stat result of the file
+            
+        Returns:
+            str: Hex digest of the file contents
+        """
+        with open(file_path, 'rb') as f:
+            if st.st_size >= MMAP_HASH_THRESHOLD:
+                # Large files: let the hash read straight from the page cache
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    hasher = _HASH_TEMPLATE.copy()
+                    hasher.update(mm)
+                    return hasher.hexdigest()
+            if sys.version_info >= (3, 11):
+                return hashlib.file_digest(f, _HASH_TEMPLATE.copy).hexdigest()
+            # Older Pythons: hash in chunks instead of reading the whole file
+            hasher = _HASH_TEMPLATE.copy()
+            while chunk := f.read(1 << 20):
+                hasher.update(chunk)
+            return hasher.hexdigest()
+
+    def _get_backups(self, module_name: str) -> List[Tuple[str, float]]:
+        """
+        Get the backup files of a module from the backup index.
+        
+        The index is built with a single scan of the backup directory on first use
+        and kept up to date by _create_backup afterwards. Entries are replaced,
+        never modified in place, so the returned list can be read without the lock.
+        
+        Args:
+            module_name (str): Name of the module
+            
+        Returns:
+            List[Tuple[str, float]]: List of (filename, mtime) tuples of the module's backups
+        """
+        with self._backup_index_lock:
+            if self._backup_index is None:
+                index: Dict[str, List[Tuple[str, float]]] = {}
+                with os.scandir(self.backup_dir) as entries:
+                    for entry in entries:
+                        # Backup files are named <module>_<YYYYmmdd>_<HHMMSS>.py
+                        parts = entry.name.rsplit("_", 2)
+                        if len(parts) != 3 or not entry.name.endswith(".py"):
+                            continue
+                        mtime = entry.stat(follow_symlinks=False).st_mtime
+                        index.setdefault(parts[0], []).append((entry.name, mtime))
+                self._backup_index = index
+            return self._backup_index.get(module_name, [])
+
+    def _set_backups(self, module_name: str, backups: List[Tuple[str, float]]) -> None:
+        """
+        Replace the backup index entry of a module. The index must already be
+        built, i.e. _get_backups has been called before.
+        
+        Args:
+            module_name (str): Name of the module
+            backups (List[Tuple[str, float]]): List of (filename, mtime) tuples of the module's backups
+        """
+        with self._backup_index_lock:
+            self._backup_index[module_name] = backups
+
     def _create_backup(self, module_name: str, source_path: str) -> str:
         """
         Create a backup of a module file if it's different from existing backups.
@@ -62,18 +202,22 @@ class ModuleReloader:
         """
         try:
             # Calculate hash of source file
-            source_hash = self._calculate_file_hash(source_path)
+            source_stat = os.stat(source_path)
+            source_hash = self._calculate_file_hash(source_path, source_stat)
             if not source_hash:
                 return ""
 
-            # Get all backup files for this module
-            backup_files = [f for f in os.listdir(self.backup_dir) 
-                          if f.startswith(f"{module_name}_") and f.endswith(".py")]
-            
             # Check if a backup with the same hash exists
-            for backup_file in backup_files:
+            for backup_file, _ in self._get_backups(module_name):
                 backup_path = os.path.join(self.backup_dir, backup_file)
-                backup_hash = self._calculate_file_hash(backup_path)
+                try:
+                    backup_stat = os.stat(backup_path)
+                except FileNotFoundError:
+                    continue
+                # Files of a different size can't have the same content, skip hashing them
+                if backup_stat.st_size != source_stat.st_size:
+                    continue
+                backup_hash = self._calculate_file_hash(backup_path, backup_stat)
                 if backup_hash == source_hash:
                     print(f"Backup already exists with same hash for {module_name}")
                     return backup_path
@@ -84,14 +228,62 @@ class ModuleReloader:
             backup_path = os.path.join(self.backup_dir, backup_filename)
             
             # Create backup
-            shutil.copy2(source_path, backup_path)
+            shutil.copyfile(source_path, backup_path)
+            backups = [b for b in self._get_backups(module_name) if b[0] != backup_filename]
+            backups.append((backup_filename, os.stat(backup_path).st_mtime))
+            self._set_backups(module_name, backups)
             print(f"Created new backup of {module_name} at {backup_path}")
+
+            self._prune_backups(module_name)
             return backup_path
             
         except Exception as e:
             print(f"Error creating backup for {module_name}: {str(e)}")
             return ""
     
+    def _prune_backups(self, module_name: str) -> None:
+        """
+        Remove the oldest backups of a module so at most MAX_BACKUPS are kept.
+        
+        Args:
+            module_name (str): Name of the module
+        """
+        backups = sorted(self._get_backups(module_name), key=lambda b: b[1], reverse=True)
+        if len(backups) <= MAX_BACKUPS:
+            return
+
+        self._set_backups(module_name, backups[:MAX_BACKUPS])
+        for backup_file, _ in backups[MAX_BACKUPS:]:
+            backup_path = os.path.join(self.backup_dir, backup_file)
+            self._hash_cache.pop(backup_path, None)
+            try:
+                os.remove(backup_path)
+                print(f"Removed old backup {backup_path}")
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"Warning: Could not remove {backup_path}: {str(e)}")
+
+    def wait_for_backup(self, module_name: str, timeout: Optional[float] = None) -> str:
+        """
+        Wait for the background backup of a module to finish.
+        
+        Args:
+            module_name (str): Name of the module
+            timeout (Optional[float]): Maximum number of seconds to wait
+            
+        Returns:
+            str: Path to the backup file, or an empty string if no backup was made
+        """
+        future = self._backup_futures.get(module_name)
+        if future is None:
+            return ""
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            print(f"Timed out waiting for backup of {module_name}")
+            return ""
+
     def _load_from_backup(self, module_name: str) -> Optional[Any]:
         """
         Attempt to load a module from its most recent backup.
@@ -103,16 +295,17 @@ class ModuleReloader:
             Optional[Any]: The loaded module if successful, None otherwise
         """
         try:
+            # Let a pending background backup of this module finish first
+            self.wait_for_backup(module_name)
+
             # Get all backup files for this module
-            backup_files = [f for f in os.listdir(self.backup_dir) 
-                          if f.startswith(f"{module_name}_") and f.endswith(".py")]
+            backup_files = self._get_backups(module_name)
             if not backup_files:
                 print(f"No backup files found for {module_name}")
                 return None
                 
-            # Sort by timestamp (newest first) and get the most recent backup
-            backup_files.sort(reverse=True)
-            latest_backup = backup_files[0]
+            # Get the most recent backup by modification time
+            latest_backup = max(backup_files, key=lambda b: b[1])[0]
             backup_path = os.path.join(self.backup_dir, latest_backup)
             
             print(f"Attempting to load {module_name} from backup: {latest_backup}")
@@ -131,59 +324,150 @@ class ModuleReloader:
             print(f"Error loading module from backup: {str(e)}")
             return None
 
-    def _create_cython_version(self, module_name: str, source_path: str) -> bool:
+    def _create_cython_versions(self, modules: List[Tuple[str, str]]) -> bool:
         """
-        Create a Cython version of the module file.
+        Create Cython versions of several module files with a single cythonize call.
         
         Args:
-            module_name (str): Name of the module
-            source_path (str): Path to the source file
+            modules (List[Tuple[str, str]]): List of (module_name, source_path) tuples
             
         Returns:
             bool: True if successful, False otherwise
         """
+        # Compile in-process instead of spawning the cythonize command line tool
         try:
-            # Create .pyx copy
-            pyx_path = source_path.replace('.py', '.pyx')
-            shutil.copy2(source_path, pyx_path)
-            print(f"Created Cython source file at {pyx_path}")
-            
-            # Run cythonize command
-            import subprocess
-            try:
-                result = subprocess.run(['cythonize', '-a', '-i', pyx_path], 
-                                 capture_output=True, 
-                                 text=True)
-            except:
-                return False
-            if result.returncode == 0:
-                print(f"Successfully Cythonized {module_name}")
-                
-                # Clean up generated files
-                base_path = os.path.splitext(pyx_path)[0]
-                files_to_remove = [
-                    f"{base_path}.c",      # C source file
-                    f"{base_path}.html",   # HTML annotation file
-                    pyx_path              # .pyx source file
-                ]
-                
-                for file in files_to_remove:
-                    try:
-                        if os.path.exists(file):
-                            os.remove(file)
-                            print(f"Cleaned up {file}")
-                    except Exception as e:
-                        print(f"Warning: Could not remove {file}: {str(e)}")
-                
-                return True
-            else:
-                print(f"Error Cythonizing {module_name}: {result.stderr}")
-                return False
-                
+            from Cython.Build import cythonize
+            from setuptools import Distribution, Extension
+        except ImportError as e:
+            print(f"Cython is not available: {str(e)}")
+            return False
+
+        names = ", ".join(module_name for module_name, _ in modules)
+        pyx_paths = []
+        try:
+            # Create .pyx copies
+            for module_name, source_path in modules:
+                pyx_path = source_path.replace('.py', '.pyx')
+                shutil.copyfile(source_path, pyx_path)
+                pyx_paths.append(pyx_path)
+                print(f"Created Cython source file at {pyx_path}")
+
+            extensions = cythonize([Extension(module_name, [pyx_path])
+                                    for (module_name, _), pyx_path in zip(modules, pyx_paths)],
+                                   nthreads=os.cpu_count() or 1,
+                                   compiler_directives=CYTHON_DIRECTIVES,
+                                   quiet=True)
+
+            # Place each compiled module next to its source, like cythonize -i
+            by_dir: Dict[str, list] = {}
+            for extension in extensions:
+                source_dir = os.path.dirname(os.path.abspath(extension.sources[0]))
+                by_dir.setdefault(source_dir, []).append(extension)
+
+            for source_dir, dir_extensions in by_dir.items():
+                with tempfile.TemporaryDirectory() as build_temp:
+                    build_ext = Distribution({'ext_modules': dir_extensions}).get_command_obj('build_ext')
+                    build_ext.build_lib = source_dir
+                    build_ext.build_temp = build_temp
+                    build_ext.parallel = os.cpu_count() or 1
+                    build_ext.ensure_finalized()
+                    build_ext.run()
+
+            print(f"Successfully Cythonized {names}")
+            return True
+
         except Exception as e:
-            print(f"Error creating Cython version: {str(e)}")
+            print(f"Error Cythonizing {names}: {str(e)}")
             return False
 
+        finally:
+            # Clean up generated files, also when the build failed
+            files_to_remove = []
+            for pyx_path in pyx_paths:
+                base_path = os.path.splitext(pyx_path)[0]
+                files_to_remove.append(f"{base_path}.c")  # C source file
+                files_to_remove.append(pyx_path)          # .pyx source file
+
+            for file in files_to_remove:
+                try:
+                    os.remove(file)
+                    print(f"Cleaned up {file}")
+                except FileNotFoundError:
+                    pass
+                except Exception as e:
+                    print(f"Warning: Could not remove {file}: {str(e)}")
+
+    def flush_cython_builds(self) -> None:
+        """
+        Compile all modules registered with use_cython=True since the last flush
+        and import their Cython versions.
+        
+        Call this once after all register_module calls, so every module is
+        built in one parallel Cython run. Modules that fail to build or import
+        are loaded from their Python source (or backup) instead.
+        """
+        pending, self._pending_cythonize = self._pending_cythonize, []
+        if not pending:
+            return
+
+        built = self._create_cython_versions(pending)
+
+        for module_name, source_path in pending:
+            module = None
+            from_backup = False
+            if built:
+                # Try to import the Cython version, first remove a Python version
+                # that may have been imported by name in the meantime
+                sys.modules.pop(module_name, None)
+                try:
+                    module = importlib.import_module(module_name)
+                    print(f"Using Cython version of {module_name}")
+                except Exception as e:
+                    sys.modules.pop(module_name, None)
+                    print(f"Failed to import Cython version: {str(e)}")
+
+            if module is None:
+                print("Falling back to Python version")
+                try:
+                    module = self._exec_module_file(module_name, source_path)
+                except Exception as e:
+                    sys.modules.pop(module_name, None)
+                    print(f"Error loading module from custom path: {str(e)}")
+                    print("Attempting to load from backup...")
+                    module = self._load_from_backup(module_name)
+                    if not module:
+                        print(f"Failed to load module {module_name} from both source and backup")
+                        continue
+                    from_backup = True
+
+            # Create backup only after successful import
+            if not from_backup:
+                self._backup_futures[module_name] = self._backup_pool.submit(
+                    self._create_backup, module_name, source_path)
+
+            sys.modules[module_name] = module
+            self._loaded_modules[module_name] = module
+            self._invalidate_function_cache(module_name)
+            self._module_dependencies[module_name] = self._get_module_dependencies(module)
+            print(f"Successfully registered module: {module_name}")
+
+    def _exec_module_file(self, module_name: str, path: str) -> Any:
+        """
+        Import a module from a source file and add it to sys.modules.
+        
+        Args:
+            module_name (str): Name of the module
+            path (str): Path to the module's source file
+            
+        Returns:
+            Any: The executed module
+        """
+        spec = _cached_spec(module_name, path, os.stat(path).st_mtime_ns)
+        foo = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = foo
+        spec.loader.exec_module(foo)
+        return foo
+
     def register_module(self, module_name: str, custom_path: Optional[str] = None, use_cython: bool = False) -> None:
         """
         Register a module for reloading.
@@ -191,7 +475,9 @@ class ModuleReloader:
         Args:
             module_name (str): The name of the module to register (e.g., 'my_module')
             custom_path (Optional[str]): Custom path to add to sys.path for module import
-            use_cython (bool): Whether to create and use a Cython version of the module
+            use_cython (bool): Whether to create and use a Cython version of the module.
+                The build and the import are deferred until flush_cython_builds() is called;
+                until then the module is not registered and cannot be used.
         """
         # If the module is already registered, their is no need to register it again with some exceptions
         if module_name in sys.modules:
@@ -203,29 +489,19 @@ class ModuleReloader:
                 sys.path.append(custom_path)
                 
                 try:
-                    spec = importlib.util.spec_from_file_location(module_name, custom_path)
-                    foo = importlib.util.module_from_spec(spec)
-                    sys.modules[module_name] = foo
-                    spec.loader.exec_module(foo)
+                    if use_cython:
+                        # Only check that the source exists, the module is imported once
+                        # after its Cython build in flush_cython_builds()
+                        os.stat(custom_path)
+                        self._pending_cythonize.append((module_name, custom_path))
+                        print(f"Queued {module_name} for Cython build")
+                        return
+
+                    foo = self._exec_module_file(module_name, custom_path)
                     
                     # Create backup only after successful import
-                    if os.path.exists(custom_path):
-                        self._create_backup(module_name, custom_path)
-                        
-                        # Create Cython version if requested
-                        if use_cython:
-                            if self._create_cython_version(module_name, custom_path):
-                                # Try to import the Cython version
-                                try:
-                                    # first remove "old" module befor loading the new one.
-                                    del sys.modules[module_name]
-                                    cython_module = importlib.import_module(module_name)
-                                    sys.modules[module_name] = cython_module
-                                    foo = cython_module
-                                    print(f"Using Cython version of {module_name}")
-                                except ImportError as e:
-                                    print(f"Failed to import Cython version: {str(e)}")
-                                    print("Falling back to Python version")
+                    self._backup_futures[module_name] = self._backup_pool.submit(
+                        self._create_backup, module_name, custom_path)
                         
                 except Exception as e:
                     print(f"Error loading module from custom path: {str(e)}")
@@ -243,6 +519,7 @@ class ModuleReloader:
                     # Import the module
                     module = importlib.import_module(module_name)
                     self._loaded_modules[module_name] = module
+                    self._invalidate_function_cache(module_name)
                     self._module_dependencies[module_name] = self._get_module_dependencies(module)
                     # Make module globally available if not already in sys.modules
                     if module_name not in sys.modules:
@@ -254,6 +531,7 @@ class ModuleReloader:
                     backup_module = self._load_from_backup(module_name)
                     if backup_module:
                         self._loaded_modules[module_name] = backup_module
+                        self._invalidate_function_cache(module_name)
                         self._module_dependencies[module_name] = self._get_module_dependencies(backup_module)
                         if module_name not in sys.modules:
                             sys.modules[module_name] = backup_module
@@ -283,12 +561,10 @@ class ModuleReloader:
         
         # Reload the module
         # reoad doesnt work for not already imported modules
-        spec = importlib.util.spec_from_file_location(module_name, self.module_path[module_name])
-        foo = importlib.util.module_from_spec(spec)
-        sys.modules[module_name] = foo
-        spec.loader.exec_module(foo)
+        foo = self._exec_module_file(module_name, self.module_path[module_name])
         #module = importlib.reload(self._loaded_modules[module_name])
         self._loaded_modules[module_name] = foo
+        self._invalidate_function_cache(module_name)
         
         # Update dependencies
         self._module_dependencies[module_name] = self._get_module_dependencies(foo)
@@ -340,16 +616,21 @@ class ModuleReloader:
         Returns:
             List[str]: List of module names that this module depends on
         """
-        dependencies = []
-        for attr_name in dir(module):
-            attr = getattr(module, attr_name)
-            if isinstance(attr, type):
-                # Get the module name of the class
-                module_name = attr.__module__
-                if module_name and module_name != module.__name__:
-                    dependencies.append(module_name)
-        return list(set(dependencies))
+        # Walk the module namespace directly and collect the module names of its classes
+        dependencies = {attr.__module__ for attr in vars(module).values()
+                        if isinstance(attr, type)
+                        and getattr(attr, '__module__', None) not in (None, module.__name__)}
+        return list(dependencies)
     
+    def _invalidate_function_cache(self, module_name: str) -> None:
+        """
+        Drop the cached functions of a module, e.g. after it was reloaded.
+        
+        Args:
+            module_name (str): The name of the module
+        """
+        self._func_cache = {k: v for k, v in self._func_cache.items() if k[0] != module_name}
+
     def get_loaded_modules(self) -> List[str]:
         """
         Get the list of all registered module names.
@@ -436,6 +717,11 @@ class ModuleReloader:
             Any: The result of the function execution if successful, None otherwise
         """
         try:
+            # Fast path: the function was already resolved by an earlier call
+            target_func = self._func_cache.get((module_name, function_name))
+            if target_func is not None:
+                return target_func(*args, **kwargs)
+
             # First try to get the module from loaded modules
             module = self._loaded_modules.get(module_name)
             if not module:
@@ -451,6 +737,7 @@ class ModuleReloader:
             if not callable(target_func):
                 print(f"Error: {function_name} in module {module_name} is not callable")
                 return None
+            self._func_cache[(module_name, function_name)] = target_func
 
             # Execute the function
             return target_func(*args, **kwargs)
@@ -482,11 +769,13 @@ if __name__ == "__main__":
     
     # Example 2: Load and execute a function from test1 module
     reloader.register_module("test1", custom_path="import_test1.py",use_cython=True)
+    reloader.flush_cython_builds()
     print("\nExample 1: Using test1 function")
     result = reloader.load_module_function("test1", "test1", a="test parameter")
     print(f"Test1 function result: {result}")
     
     reloader.register_module("test1", custom_path="import_test2.py",use_cython=True)
+    reloader.flush_cython_builds()
     print("\nExample 2: Using test2 function")
     result = reloader.load_module_function("test1", "test1", a="test parameter")
     print(f"Test2 function result: {result}")    
@@ -0,0 +1,14 @@
+# Cython declarations for module_thread_template.py.
+# When the module is compiled (see setup.py) ThreadTemplate becomes an extension
+# type with typed attributes; the plain Python module ignores this file.
+# The internal attributes are readonly so Python subclasses overriding _run can use them.
+
+cdef class ThreadTemplate:
+    cdef readonly object _stop_event
+    cdef readonly object _ready_event
+    cdef readonly object _thread
+    cdef readonly object _lock
+    cdef readonly bint _is_running
+    cdef public object main_function
+    cdef public dict main_function_parameter
+    cdef public int func_type
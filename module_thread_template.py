@@ -51,7 +51,7 @@ class ThreadTemplate:
                 print("Stopping thread...")
                 self._stop_event.set()
                 if self._thread and self._thread.is_alive():
-                    self._thread.join(timeout=0.05)
+                    self._thread.join(timeout=5.0)
                 self._is_running = False
                 print("Thread stopped successfully")
             else:
@@ -81,7 +81,8 @@ class ThreadTemplate:
                     # Your main processing logic goes here
                     # Example:
                     self.main_function(**self.main_function_parameter)
-                    time.sleep(0.05)
+                    # Throttle the loop, but wake up immediately when stop() is called
+                    self._stop_event.wait(0.05)
             if self.func_type == 0:
                 self.main_function(**self.main_function_parameter)
         except Exception as e:
@@ -0,0 +1,22 @@
+"""
+Optional build script that compiles the internal modules with Cython.
+
+Usage:
+    python setup.py build_ext --inplace
+"""
+import multiprocessing
+
+from setuptools import setup
+from Cython.Build import cythonize
+
+setup(
+    name="Dynamic_Python_Module_Manager",
+    py_modules=["module_reloader", "module_thread_template"],
+    ext_modules=cythonize(
+        ["module_thread_template.py", "module_reloader.py"],
+        # Only language_level: boundscheck/wraparound off would make any future
+        # negative index memory-unsafe, for no gain on object-typed code
+        compiler_directives={'language_level': 3},
+        nthreads=multiprocessing.cpu_count(),
+    ),
+)